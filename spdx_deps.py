@@ -1,187 +1,209 @@
 #!/usr/bin/env python3
 
 import json
+import os
 import sys
+from array import array
 from collections import defaultdict
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Any, TextIO
+from typing import Any
 
+try:
+    import orjson
+    HAVE_ORJSON = True
+except ImportError:
+    HAVE_ORJSON = False
 
-def reverse_graph(graph: dict[str, list[str]]) -> dict[str, list[str]]:
-    rev: dict[str, list[str]] = defaultdict(list)
+CsrGraph = tuple[list[str], "array[int]", "array[int]"]
+Frequencies = tuple["array[int]", "array[int]"]
 
-    for pkg, dependencies in graph.items():
-        for dep in dependencies:
-            if dep not in rev:
-                rev[dep] = []
-            rev[dep].append(pkg)
+_worker_graph: tuple[dict[str, list[str]], dict[str, str]] = ({}, {})
 
-    return rev
 
+def get_csr(graph: dict[str, list[str]]) -> CsrGraph:
+    spdx_ids = list(graph)
+    idx = {spdx_id: i for i, spdx_id in enumerate(spdx_ids)}
+    indptr = array("i", [0])
+    indices = array("i")
 
-def push_dfs(graph: dict[str, list[str]],
-             color: dict[str, str],
-             stack: list[str],
-             pkg: str) -> None:
-    color[pkg] = "gray"
+    for spdx_id in spdx_ids:
+        indices.extend(idx[dep] for dep in graph[spdx_id])
+        indptr.append(len(indices))
 
-    for dep in graph[pkg]:
-        if color[dep] == "white":
-            push_dfs(graph, color, stack, dep)
+    return spdx_ids, indptr, indices
 
-    color[pkg] = "black"
-    stack.append(pkg)
 
+def get_sccs_pearce(csr: CsrGraph) -> list[list[int]]:
+    spdx_ids, indptr, indices = csr
+    n = len(spdx_ids)
+    rindex = [0] * n
+    is_root = bytearray(n)
+    next_edge = list(indptr[:-1])
+    scc_stack: list[int] = []
+    sccs: list[list[int]] = []
+    index = 1
+    component = n - 1
 
-def label_dfs(rev_graph: dict[str, list[str]],
-              color: dict[str, str],
-              scc_pkgs: list[str],
-              pkg: str) -> None:
-    color[pkg] = "gray"
-    scc_pkgs.append(pkg)
-
-    for dep in rev_graph[pkg]:
-        if color[dep] == "white":
-            label_dfs(rev_graph, color, scc_pkgs, dep)
-
-    color[pkg] = "black"
-
-
-def get_sccs_kosaraju(graph: dict[str, list[str]]) -> list[list[str]]:
-    rev_graph = reverse_graph(graph)
-    packages = list(graph.keys())
-    color: dict[str, str] = {pkg: "white" for pkg in packages}
-    stack: list[str] = []
-
-    for pkg in packages:
-        if color[pkg] == "white":
-            push_dfs(graph, color, stack, pkg)
-
-    color = {pkg: "white" for pkg in packages}
-    sccs: list[list[str]] = []
-
-    while stack:
-        pkg = stack.pop()
-
-        if color[pkg] == "white":
-            scc_pkgs: list[str] = []
-            label_dfs(rev_graph, color, scc_pkgs, pkg)
-            sccs.append(scc_pkgs)
+    for root in range(n):
+        if rindex[root]:
+            continue
 
+        rindex[root] = index
+        index += 1
+        is_root[root] = 1
+        work = [root]
+
+        while work:
+            v = work[-1]
+            e = next_edge[v]
+
+            if e < indptr[v + 1]:
+                next_edge[v] = e + 1
+                w = indices[e]
+                if not rindex[w]:
+                    rindex[w] = index
+                    index += 1
+                    is_root[w] = 1
+                    work.append(w)
+                elif rindex[w] < rindex[v]:
+                    rindex[v] = rindex[w]
+                    is_root[v] = 0
+                continue
+
+            work.pop()
+            if is_root[v]:
+                index -= 1
+                scc = [v]
+                while scc_stack and rindex[v] <= rindex[scc_stack[-1]]:
+                    w = scc_stack.pop()
+                    rindex[w] = component
+                    index -= 1
+                    scc.append(w)
+                rindex[v] = component
+                component -= 1
+                sccs.append(scc)
+            else:
+                scc_stack.append(v)
+
+            if work and rindex[v] < rindex[work[-1]]:
+                rindex[work[-1]] = rindex[v]
+                is_root[work[-1]] = 0
+
+    sccs.reverse()
     return sccs
 
 
-def get_cyclic_sccs(graph: dict[str, list[str]]) -> list[list[str]]:
-    sccs = get_sccs_kosaraju(graph)
+def get_cyclic_sccs(csr: CsrGraph,
+                    self_loops: set[str]) -> list[list[str]]:
+    spdx_ids = csr[0]
+    sccs = get_sccs_pearce(csr)
     cycles: list[list[str]] = []
 
-    for pkgs in sccs:
-        if len(pkgs) >= 2:
-            cycles.append(pkgs)
-        elif len(pkgs) == 1:
-            pkg = pkgs[0]
-            if pkg in graph[pkg]:
-                cycles.append(pkgs)
+    for scc in sccs:
+        if len(scc) >= 2:
+            cycles.append([spdx_ids[v] for v in scc])
+        elif len(scc) == 1:
+            pkg = spdx_ids[scc[0]]
+            if pkg in self_loops:
+                cycles.append([pkg])
 
     return cycles
 
 
-def get_packages(sbom: dict[str, Any]) -> dict[str, str]:
-    packages = {}
+def get_packages(sbom_packages: Iterable[dict[str, Any]]) \
+                 -> tuple[dict[str, str], dict[str, list[str]]]:
+    packages: dict[str, str] = {}
+    package_ids: dict[str, list[str]] = defaultdict(list)
 
-    for pkg in sbom.get("packages", []):
+    for pkg in sbom_packages:
         spdx_id = pkg.get("SPDXID")
-        name = pkg.get("name", spdx_id)
+        name = str(pkg.get("name", spdx_id))
         if spdx_id and not spdx_id.startswith("SPDXRef-DocumentRoot"):
+            spdx_id = sys.intern(spdx_id)
             packages[spdx_id] = name
+            package_ids[name].append(spdx_id)
 
-    return packages
+    return packages, package_ids
 
 
 def get_package_spdx_ids(pkg_name: str,
-                         packages: dict[str, str]) -> list[str]:
-    ids = []
-
-    for spdx_id, name in packages.items():
-        if name == pkg_name:
-            ids.append(spdx_id)
-
-    return ids
+                         package_ids: dict[str, list[str]]) -> list[str]:
+    return list(package_ids.get(pkg_name, ()))
 
 
-def get_dependencies(sbom: dict[str, Any],
-                     packages: dict[str, str]) -> dict[str, list[str]]:
-    dependencies = defaultdict(list)
+def get_dependencies(relationships: Iterable[dict[str, Any]],
+                     packages: dict[str, str]) \
+                     -> tuple[dict[str, list[str]], set[str]]:
+    dependencies: dict[str, list[str]] = defaultdict(list)
+    self_loops: set[str] = set()
 
-    for rs in sbom.get("relationships", []):
+    for rs in relationships:
         if rs.get("relationshipType") != "DEPENDENCY_OF":
             continue
 
-        dependency = rs.get("spdxElementId")
-        dependent = rs.get("relatedSpdxElement")
+        dependency = sys.intern(rs["spdxElementId"])
+        dependent = sys.intern(rs["relatedSpdxElement"])
         dependencies[dependent].append(dependency)
+        if dependency == dependent:
+            self_loops.add(dependent)
 
     for spdx_id in packages:
         if spdx_id not in dependencies:
             dependencies[spdx_id] = []
 
-    return dependencies
+    return dependencies, self_loops
 
 
-def get_duplicates(packages: dict[str, str]) -> dict[str, set[str]]:
-    duplicates: dict[str, set[str]] = defaultdict(set)
-
-    for spdx_id, name in packages.items():
-        for spdx_id2, name2 in packages.items():
-            if name == name2 and spdx_id != spdx_id2:
-                if len(duplicates[name]) == 0:
-                    duplicates[name].add(spdx_id)
-                duplicates[name].add(spdx_id2)
-
-    return duplicates
+def get_dependency_names(dependencies: dict[str, list[str]],
+                         packages: dict[str, str]) -> dict[str, list[str]]:
+    return {spdx_id: sorted(packages[dep] for dep in deps)
+            for spdx_id, deps in dependencies.items()}
 
 
-def get_dependency_frequencies(dependencies: dict[str, list[str]]) \
-                               -> dict[str, tuple[int, int]]:
-    frequencies: dict[str, tuple[int, int]] = defaultdict(lambda: (0, 0))
+def get_dependency_frequencies(csr: CsrGraph) -> Frequencies:
+    spdx_ids, indptr, indices = csr
+    n = len(spdx_ids)
+    in_deg = array("i", [0]) * n
+    out_deg = array("i", (indptr[v + 1] - indptr[v] for v in range(n)))
 
-    for deps in dependencies.values():
-        for dep_id in deps:
-            dependent, _ = frequencies[dep_id]
-            frequencies[dep_id] = (dependent + 1, len(dependencies[dep_id]))
+    for v in indices:
+        in_deg[v] += 1
 
-    for spdx_id, deps in dependencies.items():
-        if spdx_id not in frequencies:
-            frequencies[spdx_id] = (0, len(deps))
+    return in_deg, out_deg
 
-    return frequencies
 
-
-def print_dependencies(dependencies: dict[str, list[str]],
+def print_dependencies(dependency_names: dict[str, list[str]],
                        packages: dict[str, str]) -> None:
     print("\nDependencies:")
 
     for spdx_id, name in packages.items():
-        dep_names = [packages[dep] for dep in sorted(dependencies[spdx_id])]
-        print(f"{name}: {', '.join(dep_names)}")
+        print(f"{name}: {', '.join(dependency_names[spdx_id])}")
 
 
-def print_duplicates(duplicates: dict[str, set[str]]) -> None:
+def print_duplicates(package_ids: dict[str, list[str]]) -> None:
     print("\nDuplicate package names:")
 
-    for name, spdx_ids in duplicates.items():
-        print(f"{name}: {', '.join(sorted(spdx_ids))}")
+    for name, spdx_ids in package_ids.items():
+        if len(spdx_ids) >= 2:
+            print(f"{name}: {', '.join(sorted(spdx_ids))}")
 
 
-def print_frequencies(frequencies: dict[str, tuple[int, int]],
+def print_frequencies(frequencies: Frequencies,
+                      spdx_ids: list[str],
                       packages: dict[str, str]) -> None:
     print("\nDependency frequencies (package: dependants - arrows inward, "
           "dependencies - arrows outward):")
 
-    for spdx_id, freq in sorted(frequencies.items(), key=lambda item: item[1],
-                                reverse=True):
-        dependant, dependencies = freq
-        print(f"{packages[spdx_id]}: {dependant}, {dependencies}")
+    in_deg, out_deg = frequencies
+    idx = {spdx_id: v for v, spdx_id in enumerate(spdx_ids)}
+    keys = list(zip(in_deg, out_deg))
+    order = sorted((idx[spdx_id] for spdx_id in packages),
+                   key=keys.__getitem__, reverse=True)
+
+    for v in order:
+        print(f"{packages[spdx_ids[v]]}: {in_deg[v]}, {out_deg[v]}")
 
 
 def print_cycles(cycles: list[list[str]],
@@ -196,27 +218,53 @@ def print_cycles(cycles: list[list[str]],
 def draw_package(spdx_id: str,
                  dependencies: dict[str, list[str]],
                  packages: dict[str, str],
-                 to_highlight: list[str],
+                 to_highlight: frozenset[str],
                  visited: set[str],
-                 f: TextIO) -> None:
-    visited.add(spdx_id)
+                 quoted: dict[str, bytes],
+                 parts: list[bytes]) -> None:
+    work: list[tuple[bytes, Iterator[str]]] = []
+    write = parts.append
 
-    if spdx_id in to_highlight:
-        color = "cyan"
-    else:
-        color = "white"
+    def quote(node: str) -> bytes:
+        q = quoted.get(node)
+        if q is None:
+            q = quoted[node] = f'"{node}"'.encode()
+        return q
+
+    def visit(node: str) -> None:
+        visited.add(node)
+
+        if node in to_highlight:
+            color = b"cyan"
+        else:
+            color = b"white"
+
+        q = quote(node)
+        write(b'%s [label="%s" style=filled fillcolor="%s"]\n'
+              % (q, f'{packages[node]}'.encode(), color))
+
+        work.append((q, iter(dependencies[node])))
 
-    f.write(f'"{spdx_id}" ['
-            f'label="{packages[spdx_id]}" '
-            f'style=filled '
-            f'fillcolor="{color}"'
-            f']\n')
+    visit(spdx_id)
 
-    for dep_id in dependencies[spdx_id]:
-        f.write(f'"{spdx_id}" -> "{dep_id}"\n')
+    while work:
+        q, deps = work[-1]
+        dep_id = next(deps, None)
+
+        if dep_id is None:
+            work.pop()
+            continue
+
+        write(b"%s -> %s\n" % (q, quote(dep_id)))
         if dep_id not in visited:
-            draw_package(dep_id, dependencies, packages, to_highlight, visited,
-                         f)
+            visit(dep_id)
+
+
+def write_dot(parts: list[bytes], filename: str) -> None:
+    with open(filename, "wb") as f:
+        f.write(b"digraph Dependencies {\n")
+        f.write(b"".join(parts))
+        f.write(b"}\n")
 
 
 def draw_dependencies_package(dependencies: dict[str, list[str]],
@@ -224,62 +272,137 @@ def draw_dependencies_package(dependencies: dict[str, list[str]],
                               pkg_spdx_id: str,
                               to_highlight: list[str],
                               filename: str) -> None:
-    with open(filename, "w", encoding="utf-8") as f:
-        f.write("digraph Dependencies {\n")
-        draw_package(pkg_spdx_id, dependencies, packages, to_highlight, set(),
-                     f)
-        f.write("}\n")
+    parts: list[bytes] = []
+    draw_package(pkg_spdx_id, dependencies, packages, frozenset(to_highlight),
+                 set(), {}, parts)
+    write_dot(parts, filename)
 
 
 def draw_dependencies_all(dependencies: dict[str, list[str]],
                           packages: dict[str, str],
                           filename: str) -> None:
-    with open(filename, "w", encoding="utf-8") as f:
-        f.write("digraph Dependencies {\n")
+    parts: list[bytes] = []
 
-        visited: set[str] = set()
-        for spdx_id in packages:
-            if spdx_id not in visited:
-                draw_package(spdx_id, dependencies, packages, [], visited, f)
+    visited: set[str] = set()
+    quoted: dict[str, bytes] = {}
+    for spdx_id in packages:
+        if spdx_id not in visited:
+            draw_package(spdx_id, dependencies, packages, frozenset(), visited,
+                         quoted, parts)
 
-        f.write("}\n")
+    write_dot(parts, filename)
 
 
-def draw_cycles(dependencies: dict[str, list[str]],
-                packages: dict[str, str],
-                cycles: list[list[str]]) -> None:
+def get_cycle_jobs(cycles: list[list[str]],
+                   packages: dict[str, str]) \
+                   -> list[tuple[str, list[str], str]]:
+    jobs = []
+
     for i, c in enumerate(cycles):
         pkg_spdx_id = c[0]
         pkg_name = packages[pkg_spdx_id]
+        jobs.append((pkg_spdx_id, c, f'cycle{i + 1}-{pkg_name}.dot'))
+
+    return jobs
+
+
+def draw_cycles(dependencies: dict[str, list[str]],
+                packages: dict[str, str],
+                cycles: list[list[str]]) -> None:
+    for pkg_spdx_id, c, filename in get_cycle_jobs(cycles, packages):
         draw_dependencies_package(dependencies, packages, pkg_spdx_id, c,
-                                  f'cycle{i + 1}-{pkg_name}.dot')
+                                  filename)
+
+
+def init_cycle_worker(dependencies: dict[str, list[str]],
+                      packages: dict[str, str]) -> None:
+    global _worker_graph
+    _worker_graph = (dependencies, packages)
+
+
+def draw_cycle(pkg_spdx_id: str, cycle: list[str], filename: str) -> None:
+    dependencies, packages = _worker_graph
+    draw_dependencies_package(dependencies, packages, pkg_spdx_id, cycle,
+                              filename)
+
 
+def get_available_cpus() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
 
-def main(argv: list[str]) -> None:
+    return os.cpu_count() or 1
+
+
+def draw_dot_files(dependencies: dict[str, list[str]],
+                   packages: dict[str, str],
+                   cycles: list[list[str]],
+                   filename: str,
+                   workers: int) -> None:
+    if workers == 0:
+        workers = get_available_cpus()
+    workers = min(workers, len(cycles))
+
+    if workers <= 1:
+        draw_dependencies_all(dependencies, packages, filename)
+        draw_cycles(dependencies, packages, cycles)
+        return
+
+    jobs = get_cycle_jobs(cycles, packages)
+    chunksize = max(1, len(jobs) // (4 * workers))
+    sys.stdout.flush()
+
+    with ProcessPoolExecutor(workers, initializer=init_cycle_worker,
+                             initargs=(dependencies, packages)) as executor:
+        results = executor.map(draw_cycle, *zip(*jobs), chunksize=chunksize)
+        draw_dependencies_all(dependencies, packages, filename)
+        list(results)
+
+
+def load_sbom(sbom_path: str) -> dict[str, Any]:
+    sbom: dict[str, Any]
+
+    if HAVE_ORJSON:
+        sbom = orjson.loads(Path(sbom_path).read_bytes())
+    else:
+        with open(sbom_path, "r", encoding="utf-8") as s:
+            sbom = json.load(s)
+
+    return sbom
+
+
+def main(argv: list[str], workers: int = 1) -> None:
     sbom_path = argv[1]
+    sbom = load_sbom(sbom_path)
 
-    with open(sbom_path, "r", encoding="utf-8") as s:
-        sbom = json.load(s)
+    packages, package_ids = get_packages(sbom.get("packages", []))
+    dependencies, self_loops = get_dependencies(sbom.get("relationships", []),
+                                                packages)
+    del sbom
 
-    packages = get_packages(sbom)
-    dependencies = get_dependencies(sbom, packages)
-    duplicates = get_duplicates(packages)
-    frequencies = get_dependency_frequencies(dependencies)
-    cycles = get_cyclic_sccs(dependencies)
+    csr = get_csr(dependencies)
+    dependency_names = get_dependency_names(dependencies, packages)
+    frequencies = get_dependency_frequencies(csr)
+    cycles = get_cyclic_sccs(csr, self_loops)
 
-    print_dependencies(dependencies, packages)
-    print_duplicates(duplicates)
-    print_frequencies(frequencies, packages)
+    print_dependencies(dependency_names, packages)
+    print_duplicates(package_ids)
+    print_frequencies(frequencies, csr[0], packages)
     print_cycles(cycles, packages)
 
-    draw_dependencies_all(dependencies, packages,
-                          f"{Path(sbom_path).stem}.dot")
-    draw_cycles(dependencies, packages, cycles)
+    draw_dot_files(dependencies, packages, cycles,
+                   f"{Path(sbom_path).stem}.dot", workers)
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: spdx_deps.py <sbom.spdx.json>")
+    args = sys.argv[1:]
+    workers = 1
+
+    if len(args) == 3 and args[0] == "-j" and args[1].isdigit():
+        workers = int(args[1])
+        args = args[2:]
+
+    if len(args) != 1:
+        print("Usage: spdx_deps.py [-j WORKERS] <sbom.spdx.json>")
         sys.exit(1)
 
-    main(sys.argv)
+    main([sys.argv[0], *args], workers)